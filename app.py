@@ -1,11 +1,15 @@
 import streamlit as st
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+import lxml.html
 from google import genai
 from google.genai.errors import APIError
+import os
 import time
+import threading
 import pandas as pd
-import json
+import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Configuration ---
 GEMINI_MODEL = "gemini-2.5-flash"
@@ -16,14 +20,98 @@ st.set_page_config(
     menu_items=None
 )
 
+# --- Navigation Tabs ---
+NAV_TABS = ("SEC Filings Analyzer", "Global Filings Browser", "Dashboard")
+
 # --- Define Major Companies for Global View ---
 # We must aggregate data from specific companies since there is no single "All Filings" public API endpoint.
 MAJOR_TICKERS = ["MSFT", "AAPL", "GOOGL", "AMZN", "NVDA", "TSLA", "JPM", "V", "JNJ", "WMT"]
+# Form types kept when only major reports are requested.
+REPORT_FORM_TYPES = frozenset({'10-K', '10-Q', '8-K', 'S-3', 'S-1'})
+# Bounded so concurrent ticker fetches stay well under the SEC's 10 requests/second fair-access limit.
+MAX_FETCH_WORKERS = 5
+
+# --- SEC Request Headers ---
+# Built once instead of per call; the SEC requires a descriptive User-Agent on every request.
+SEC_HEADERS = {'User-Agent': 'FinancialDashboardApp / myname@example.com'}
+
+# SEC fair-access policy allows at most 10 requests per second per client.
+SEC_MAX_REQUESTS_PER_SECOND = 10
+# Requests allowed back-to-back before pacing starts. The refill rate is the remainder, so even a
+# full burst followed by a second of refills stays within the SEC limit.
+SEC_REQUEST_BURST = 2
+# Seconds to wait for a connection or between response bytes before giving up on an SEC request.
+SEC_REQUEST_TIMEOUT = 10
+
+# Shared HTML parser for filing pages. huge_tree lifts libxml2's ~255 element depth limit; without it,
+# old EDGAR filings with unclosed <font> tags are silently cut short or come back empty.
+FILING_HTML_PARSER = lxml.html.HTMLParser(huge_tree=True)
+
+# --- Local Disk Cache ---
+# The ticker map survives app restarts here and doubles as a fallback when the SEC is unreachable.
+TICKER_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".sec-app-cache", "tickers.json")
+TICKER_CACHE_MAX_AGE = 86400 # Seconds
+
+# --- Shared SEC HTTP Session ---
+@st.cache_resource
+def get_sec_session():
+    """
+    Returns a process-wide requests.Session so every SEC call reuses pooled keep-alive
+    connections instead of paying a fresh TCP+TLS handshake. Cached as a resource because
+    Streamlit re-executes this script on every rerun.
+    """
+    session = requests.Session()
+    session.headers.update(SEC_HEADERS)
+    # No adapter-level retries: urllib3 would replay requests without taking a rate-limiter token,
+    # so retrying is left to callers, whose retries go back through sec_get.
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+
+class RateLimiter:
+    """Thread-safe token bucket: bursts proceed immediately, sustained load waits for tokens."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                # Holding the lock while waiting keeps later callers queued behind this one
+                time.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 0
+                self.updated = time.monotonic()
+            else:
+                self.tokens -= 1
+
+
+@st.cache_resource
+def get_sec_limiter():
+    """Returns the process-wide limiter shared by every SEC request, across threads and sessions."""
+    return RateLimiter(SEC_MAX_REQUESTS_PER_SECOND - SEC_REQUEST_BURST, burst=SEC_REQUEST_BURST)
+
+
+def sec_get(url):
+    """Issues a rate-limited GET to the SEC over the shared session."""
+    get_sec_limiter().acquire()
+    return get_sec_session().get(url, timeout=SEC_REQUEST_TIMEOUT)
 
 # --- Initialize Gemini Client ---
+@st.cache_resource
+def get_gemini_client(api_key):
+    """Builds the Gemini client once per process instead of on every Streamlit rerun."""
+    return genai.Client(api_key=api_key)
+
 try:
     if "GEMINI_API_KEY" in st.secrets:
-        client = genai.Client(api_key=st.secrets["GEMINI_API_KEY"])
+        client = get_gemini_client(st.secrets["GEMINI_API_KEY"])
     else:
         st.error("Gemini API Key not found in Streamlit secrets. Please check .streamlit/secrets.toml.")
         client = None 
@@ -41,7 +129,7 @@ st.markdown("""
 .stSidebar {
     background-color: #161b22;
 }
-.stButton>button {
+.stButton>button, .stFormSubmitButton>button {
     background-color: #238636;
     color: white;
     font-weight: bold;
@@ -49,7 +137,7 @@ st.markdown("""
     border: 1px solid #30363d;
     transition: all 0.2s;
 }
-.stButton>button:hover {
+.stButton>button:hover, .stFormSubmitButton>button:hover {
     background-color: #2ea043;
     border-color: #8b949e;
 }
@@ -69,26 +157,76 @@ h1, h2, h3 {
 
 # --- Core Search Function (Direct SEC EDGAR API) ---
 
+def read_ticker_cache(max_age=None):
+    """Returns the ticker map saved on disk, or None if it is missing, unreadable or older than max_age."""
+    try:
+        if max_age is not None and time.time() - os.path.getmtime(TICKER_CACHE_PATH) > max_age:
+            return None
+        with open(TICKER_CACHE_PATH, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_ticker_cache(ticker_map):
+    """Saves the ticker map to disk atomically; failures are ignored since the disk copy is only an optimization."""
+    try:
+        os.makedirs(os.path.dirname(TICKER_CACHE_PATH), exist_ok=True)
+        tmp_path = TICKER_CACHE_PATH + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(ticker_map))
+        os.replace(tmp_path, TICKER_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def normalize_ticker(ticker):
+    """Maps user input onto the SEC ticker list's spelling, e.g. ' brk.b' -> 'BRK-B'."""
+    return ticker.strip().upper().replace('.', '-')
+
+
+@st.cache_resource(show_spinner=False, ttl=86400) # The SEC ticker list changes rarely; refresh daily
+def load_ticker_map():
+    """
+    Returns a {TICKER: zero-padded CIK} dict, so each ticker lookup is a dict access instead
+    of a ~1 MB download and linear scan. A fresh copy on disk is preferred over the network.
+    Network errors propagate so they are never cached. The dict is shared across sessions and
+    must not be mutated by callers.
+    """
+    ticker_map = read_ticker_cache(max_age=TICKER_CACHE_MAX_AGE)
+    if ticker_map is not None:
+        return ticker_map
+
+    response = sec_get("https://www.sec.gov/files/company_tickers.json")
+    response.raise_for_status()
+    ticker_map = {item['ticker']: str(item['cik_str']).zfill(10) for item in orjson.loads(response.content).values()}
+    write_ticker_cache(ticker_map)
+    return ticker_map
+
+
+def get_ticker_map():
+    """
+    Returns the cached ticker map, or the last copy saved on disk (however old) if the SEC cannot
+    be reached. The fallback is deliberately left uncached so the next call retries the network.
+    """
+    try:
+        return load_ticker_map()
+    except requests.exceptions.RequestException:
+        ticker_map = read_ticker_cache()
+        if ticker_map is None:
+            raise
+        return ticker_map
+
+
 @st.cache_data(show_spinner=False, ttl=3600) # Cache for 1 hour to reduce SEC load
 def fetch_sec_filings(ticker, limit=20, max_retries=3, all_filings=False): 
     """
     Fetches CIK and recent filings for a single ticker. Reduced limit and retries 
     to manage rate limits, especially when running multiple tickers.
     """
-    headers = {'User-Agent': 'FinancialDashboardApp / myname@example.com'} 
-    
     # 1. Get CIK
-    cik_number = None
     try:
-        cik_lookup_url = f"https://www.sec.gov/files/company_tickers.json"
-        cik_response = requests.get(cik_lookup_url, headers=headers)
-        cik_response.raise_for_status()
-        cik_map = cik_response.json()
-        
-        for item in cik_map.values():
-            if item['ticker'] == ticker.upper():
-                cik_number = str(item['cik_str']).zfill(10)
-                break
+        cik_number = get_ticker_map().get(normalize_ticker(ticker))
         
         if not cik_number:
             return [], f"SEC API Error: Could not find CIK for ticker {ticker}."
@@ -100,13 +238,13 @@ def fetch_sec_filings(ticker, limit=20, max_retries=3, all_filings=False):
     final_error = None
     for attempt in range(max_retries):
         try:
-            wait_time = 3.0 + 3 * attempt # Shorter wait time since we are fetching less data per call
-            time.sleep(wait_time) 
+            if attempt:
+                time.sleep(3 * attempt) # Back off before retrying; request pacing is handled by sec_get
             
             filings_url = f"https://data.sec.gov/submissions/CIK{cik_number}.json"
-            filings_response = requests.get(filings_url, headers=headers)
+            filings_response = sec_get(filings_url)
             filings_response.raise_for_status()
-            data = filings_response.json()
+            data = orjson.loads(filings_response.content)
             
             company_name = data.get('name', ticker) # Get the full company name
             recent_filings = []
@@ -130,7 +268,7 @@ def fetch_sec_filings(ticker, limit=20, max_retries=3, all_filings=False):
                 filing_type = filing_types[i]
                 
                 # Filter to common types OR if all_filings is requested, AND respect limit
-                is_report_type = filing_type in ['10-K', '10-Q', '8-K', 'S-3', 'S-1']
+                is_report_type = filing_type in REPORT_FORM_TYPES
                 should_add_filing = (all_filings or is_report_type) and len(recent_filings) < limit
                 
                 if should_add_filing:
@@ -161,7 +299,7 @@ def fetch_sec_filings(ticker, limit=20, max_retries=3, all_filings=False):
     
         except requests.exceptions.RequestException as e:
             final_error = f"Network Error for {ticker}: {e}"
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             final_error = f"JSON Decode Error for {ticker}."
         except Exception as e:
             final_error = f"Unexpected error for {ticker}: {type(e).__name__} - {e}"
@@ -179,17 +317,24 @@ def fetch_all_major_filings(tickers):
         st.info(f"Loading recent filings for {len(tickers)} major companies. This may take a moment due to SEC rate limits.")
         progress_bar = st.progress(0)
     
-        for i, ticker in enumerate(tickers):
-            progress_bar.progress((i + 1) / len(tickers), text=f"Fetching filings for {ticker}...")
-            
+        # Tickers are fetched concurrently (I/O bound); progress is only updated here on the script thread.
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
             # Fetch only major reports (10-K, 10-Q, 8-K etc.) for a cleaner aggregated view
-            filings, error = fetch_sec_filings(ticker, limit=15, all_filings=False)
+            futures = {
+                executor.submit(fetch_sec_filings, ticker, limit=15, all_filings=False): ticker
+                for ticker in tickers
+            }
             
-            if filings:
-                all_filings_data.extend(filings)
-            elif error and "Error during CIK lookup" not in error and "No relevant filings found" not in error:
-                 # Log only severe errors, ignoring "No filings found" which is common
-                failed_tickers.append(f"{ticker}: {error}")
+            for i, future in enumerate(as_completed(futures)):
+                ticker = futures[future]
+                progress_bar.progress((i + 1) / len(tickers), text=f"Fetched filings for {ticker}...")
+                filings, error = future.result()
+                
+                if filings:
+                    all_filings_data.extend(filings)
+                elif error and "Error during CIK lookup" not in error and "No relevant filings found" not in error:
+                     # Log only severe errors, ignoring "No filings found" which is common
+                    failed_tickers.append(f"{ticker}: {error}")
 
         progress_bar.empty()
 
@@ -198,45 +343,58 @@ def fetch_all_major_filings(tickers):
     
     return all_filings_data
 
-# --- Scraping and Analysis Functions (Unchanged) ---
-def scrape_filing_content(filing_url):
-    """Fetches and cleans the text content from the main filing document."""
-    try:
-        headers = {'User-Agent': 'FinancialDashboardApp / myname@example.com'} 
-        index_response = requests.get(filing_url, headers=headers)
-        index_response.raise_for_status()
-        index_soup = BeautifulSoup(index_response.content, 'html.parser')
-        main_doc_link = index_soup.find('a', href=lambda href: href and (href.endswith('.htm') or href.endswith('.html')) and 'index' not in href.lower())
-        
-        if not main_doc_link:
-            return None, "Error: Could not find the main HTML document link within the filing index."
+# --- Scraping and Analysis Functions ---
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=16) # Filings are immutable; re-running an analysis skips the download
+def fetch_filing_text(filing_url):
+    """
+    Downloads the main document behind a filing index URL and returns its whitespace-normalized
+    text, or None if the index has no HTML document link. Errors propagate so they are not cached.
+    """
+    index_response = sec_get(filing_url)
+    index_response.raise_for_status()
+    # Only the link targets are needed from the index page; a single XPath pulls them in C
+    index_tree = lxml.html.fromstring(index_response.content, parser=FILING_HTML_PARSER)
+    main_doc_path = next(
+        (href for href in index_tree.xpath('//a/@href')
+         if href.endswith(('.htm', '.html')) and 'index' not in href.lower()),
+        None
+    )
+    
+    if not main_doc_path:
+        return None
 
-        main_doc_path = main_doc_link['href']
-        base_url = filing_url.rsplit('/', 1)[0] + '/'
-        main_doc_url = base_url + main_doc_path
+    base_url = filing_url.rsplit('/', 1)[0] + '/'
+    main_doc_url = base_url + main_doc_path
 
-        doc_response = requests.get(main_doc_url, headers=headers)
-        doc_response.raise_for_status()
-        doc_soup = BeautifulSoup(doc_response.content, 'html.parser')
-        
-        for script_or_style in doc_soup(["script", "style"]):
-            script_or_style.decompose()
-            
-        text = doc_soup.get_text()
-        clean_text = ' '.join(text.split())
-        
-        MAX_CHARS = 500000 
-        if len(clean_text) > MAX_CHARS:
-            st.warning(f"Filing content was truncated from {len(clean_text):,} to {MAX_CHARS:,} characters to fit the API context window.")
-            clean_text = clean_text[:MAX_CHARS]
+    doc_response = sec_get(main_doc_url)
+    doc_response.raise_for_status()
+    doc_tree = lxml.html.fromstring(doc_response.content, parser=FILING_HTML_PARSER)
+    
+    for script_or_style in doc_tree.xpath('//script | //style'):
+        script_or_style.drop_tree()
         
-        return clean_text, None
+    return ' '.join(doc_tree.text_content().split())
+
 
+def scrape_filing_content(filing_url):
+    """Fetches and cleans the text content from the main filing document."""
+    try:
+        clean_text = fetch_filing_text(filing_url)
     except requests.exceptions.RequestException as e:
         return None, f"Network/HTTP Error during scraping: {e}"
     except Exception as e:
         return None, f"An unexpected error occurred during scraping: {e}"
 
+    if clean_text is None:
+        return None, "Error: Could not find the main HTML document link within the filing index."
+    
+    MAX_CHARS = 500000 
+    if len(clean_text) > MAX_CHARS:
+        st.warning(f"Filing content was truncated from {len(clean_text):,} to {MAX_CHARS:,} characters to fit the API context window.")
+        clean_text = clean_text[:MAX_CHARS]
+    
+    return clean_text, None
+
 
 def analyze_filing_content(content, analysis_prompt):
     """Calls the Gemini API to analyze the scraped content."""
@@ -277,7 +435,7 @@ def main_app():
     if 'selected_tab' not in st.session_state:
         st.session_state['selected_tab'] = "SEC Filings Analyzer"
     if 'global_filings_data' not in st.session_state:
-        st.session_state['global_filings_data'] = []
+        st.session_state['global_filings_data'] = None
     
     # --- Sidebar Input Section ---
     
@@ -295,7 +453,7 @@ def main_app():
             st.session_state['analysis_ticker'] = ticker_input
             st.session_state['run_search'] = True
             st.session_state['selected_tab'] = "SEC Filings Analyzer"
-            st.cache_data.clear() 
+            fetch_sec_filings.clear() # Refresh filings but keep the cached ticker map
         else:
             st.sidebar.warning("Please enter a ticker symbol.")
 
@@ -308,7 +466,7 @@ def main_app():
     if st.sidebar.button("Load Global Filings", key="sidebar_load_global_button"):
         st.session_state['run_global_filings_search'] = True
         st.session_state['selected_tab'] = "Global Filings Browser"
-        st.session_state['global_filings_data'] = [] # Clear previous data
+        st.session_state['global_filings_data'] = None # Clear previous data
 
     st.sidebar.markdown("---")
 
@@ -317,8 +475,8 @@ def main_app():
     
     selected_tab = st.sidebar.radio(
         "Go to",
-        ("SEC Filings Analyzer", "Global Filings Browser", "Dashboard"),
-        index=("SEC Filings Analyzer", "Global Filings Browser", "Dashboard").index(st.session_state['selected_tab']),
+        NAV_TABS,
+        index=NAV_TABS.index(st.session_state['selected_tab']),
         key="navigation_radio"
     )
     st.session_state['selected_tab'] = selected_tab
@@ -345,7 +503,16 @@ def main_app():
                 df_global = df_global.sort_values(by='Date', ascending=False)
                 df_global['Date'] = df_global['Date'].dt.strftime('%Y-%m-%d') # Format back for display
                 
-                st.session_state['global_filings_data'] = df_global.to_dict('records')
+                # Create a combined 'Filing Link' column for easy access in the analyzer.
+                # Built once here and stored with the frame, so reruns only re-render it.
+                df_global['Filing Link'] = (
+                    df_global['Company'] + ' (' + 
+                    df_global['Ticker'] + ') - ' + 
+                    df_global['Type'] + ' (' + 
+                    df_global['Date'] + ')'
+                )
+                
+                st.session_state['global_filings_data'] = df_global.reset_index(drop=True)
                 
                 st.subheader(f"Found {len(df_global)} recent major filings.")
                 
@@ -357,25 +524,17 @@ def main_app():
             st.experimental_rerun()
         
         # Display the stored data if it exists (handles display after rerun)
-        if st.session_state['global_filings_data']:
-            df_display_global = pd.DataFrame(st.session_state['global_filings_data'])
+        if st.session_state['global_filings_data'] is not None:
+            df_display_global = st.session_state['global_filings_data']
             
-            # Create a combined 'Filing Link' column for easy access in the analyzer
-            df_display_global['Filing Link'] = (
-                df_display_global['Company'] + ' (' + 
-                df_display_global['Ticker'] + ') - ' + 
-                df_display_global['Type'] + ' (' + 
-                df_display_global['Date'] + ')'
-            )
-            
-            # Select relevant columns for display
-            df_table = df_display_global[['Company', 'Ticker', 'Type', 'Date', 'Filing Link']].copy()
+            # Project only the displayed columns so the serialized table stays small
+            df_table = df_display_global[['Company', 'Ticker', 'Type', 'Date']]
             
             st.markdown("**Select a row to use the filing's URL in the Analyzer tab.**")
             
             # Make the table selectable
             selected_rows = st.dataframe(
-                df_table.drop(columns=['Filing Link']), 
+                df_table, 
                 height=600, 
                 use_container_width=True,
                 hide_index=True,
@@ -460,15 +619,18 @@ def main_app():
                 f"**View Full Filing:** [Open Document Link]({st.session_state['selected_filing_url']})"
             )
 
-            analysis_prompt = st.text_area(
-                "**AI Analysis Prompt (Gemini API):**",
-                value=st.session_state.get('analysis_prompt', "Summarize the key events and material impacts discussed in the 'Management's Discussion and Analysis' section."),
-                height=100
-            )
+            # A form batches prompt edits into a single rerun when the analysis is submitted
+            with st.form("analysis_form"):
+                analysis_prompt = st.text_area(
+                    "**AI Analysis Prompt (Gemini API):**",
+                    value=st.session_state.get('analysis_prompt', "Summarize the key events and material impacts discussed in the 'Management's Discussion and Analysis' section."),
+                    height=100
+                )
+                run_analysis = st.form_submit_button("Run AI Analysis")
             
             st.session_state['analysis_prompt'] = analysis_prompt 
 
-            if st.button("Run AI Analysis", key="run_ai_analysis"):
+            if run_analysis:
                 st.session_state['analysis_result'] = ""
                 
                 with st.spinner(f"1/2: Scraping content from {st.session_state['selected_filing_name']}..."):